@@ -24,9 +24,7 @@
 """A colored progress bar for `ffmpeg` using `tqdm`.
 """
 
-from __future__ import unicode_literals
-from __future__ import print_function
-
+import collections
 import locale
 import os
 import re
@@ -34,16 +32,12 @@ import signal
 import sys
 import subprocess
 
-if sys.version_info < (3, 0):
-    import Queue as queue
-    input = raw_input
-else:
-    import queue
-    unicode = str
-
 from tqdm import tqdm
 
 
+_PROMPT_SUFFIX = b"[y/N] "
+
+
 class Colors:
     """ANSI color codes for terminal output"""
     RESET = '\033[0m'
@@ -81,16 +75,80 @@ class Colors:
     BG_WHITE = '\033[47m'
 
 
+# Module-level aliases of the codes used when rendering, to avoid resolving
+# class attributes on every call
+_RESET = Colors.RESET
+_BOLD = Colors.BOLD
+_WHITE = Colors.WHITE
+_BRIGHT_RED = Colors.BRIGHT_RED
+_BRIGHT_GREEN = Colors.BRIGHT_GREEN
+_BRIGHT_YELLOW = Colors.BRIGHT_YELLOW
+_BRIGHT_BLUE = Colors.BRIGHT_BLUE
+_BRIGHT_CYAN = Colors.BRIGHT_CYAN
+_BRIGHT_WHITE = Colors.BRIGHT_WHITE
+
+
+# Whether ANSI escape sequences could be enabled on Windows, computed
+# at most once per process by `_enable_windows_color`
+_COLOR_SUPPORT = None
+
+
+def _enable_windows_color():
+    """Enable ANSI escape sequences on Windows 10+"""
+    global _COLOR_SUPPORT
+    if _COLOR_SUPPORT is None:
+        try:
+            import colorama
+            colorama.init()
+            _COLOR_SUPPORT = True
+        except ImportError:
+            # Try to enable ANSI escape sequences on Windows
+            try:
+                import ctypes
+                kernel32 = ctypes.windll.kernel32
+                kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
+                _COLOR_SUPPORT = True
+            except:
+                _COLOR_SUPPORT = False
+    return _COLOR_SUPPORT
+
+
+def _terminal_supports_color(is_nt, is_atty):
+    """Check if terminal supports color output"""
+    if is_nt:
+        return _enable_windows_color()
+    else:
+        # Unix-like systems
+        return is_atty
+
+
 class ColoredProgressNotifier(object):
 
-    _DURATION_RX = re.compile(rb"Duration: (\d{2}):(\d{2}):(\d{2})\.\d{2}")
-    _PROGRESS_RX = re.compile(rb"time=(\d{2}):(\d{2}):(\d{2})\.\d{2}")
-    _SOURCE_RX = re.compile(rb"from '(.*)':")
-    _FPS_RX = re.compile(rb"(\d{2}\.\d{2}|\d{2}) fps")
+    _PROGRESS_RX = re.compile(rb"time=(\d{2}):(\d{2}):(\d{2})")
+    _NEWLINE_RX = re.compile(rb"([\r\n])")
+    _SCAN_RX = re.compile(
+        rb"(?P<duration>Duration: (\d{2}):(\d{2}):(\d{2}))"
+        rb"|(?P<progress>" + _PROGRESS_RX.pattern + rb")"
+        rb"|(?P<source>from '(.*)':)"
+        rb"|(?P<fps>(\d{2})(?:\.(\d{2}))? fps)"
+    )
 
     @staticmethod
-    def _seconds(hours, minutes, seconds):
-        return (int(hours) * 60 + int(minutes)) * 60 + int(seconds)
+    def _seconds(h, m, s):
+        # fixed-width ASCII digits, converted with byte arithmetic rather
+        # than int() since this runs for every status line
+        return (
+            ((h[0] - 48) * 10 + h[1] - 48) * 3600
+            + ((m[0] - 48) * 10 + m[1] - 48) * 60
+            + (s[0] - 48) * 10 + s[1] - 48
+        )
+
+    @staticmethod
+    def _fps(units, hundredths=None):
+        # round to the nearest integer without going through a float
+        if hundredths is not None and hundredths >= b"50":
+            return int(units) + 1
+        return int(units)
 
     def __enter__(self):
         return self
@@ -100,39 +158,39 @@ class ColoredProgressNotifier(object):
             self.pbar.close()
 
     def __init__(self, file=None, encoding=None, tqdm=tqdm, use_colors=True):
-        self.lines = []
+        # only the last line is needed, to report errors from ffmpeg
+        self.lines = collections.deque(maxlen=1)
         self.line_acc = bytearray()
         self.duration = None
         self.source = None
+        self._desc = None
         self.started = False
         self.pbar = None
         self.fps = None
+        self._headers_done = False
         self.file = file or sys.stderr
-        self.encoding = encoding or locale.getpreferredencoding() or 'UTF-8'
+        self.encoding = encoding or locale.getpreferredencoding(False) or 'UTF-8'
         self.tqdm = tqdm
         self.use_colors = use_colors and self._supports_color()
-        self.colors = Colors() if self.use_colors else None
+        if self.use_colors:
+            self._bar_format = (
+                f'{_BRIGHT_WHITE}{{desc}}: '
+                f'{_BRIGHT_GREEN}{{percentage:3.0f}}%'
+                f'{_RESET}|{_BRIGHT_BLUE}{{bar}}{_RESET}| '
+                f'{_WHITE}{{n_fmt}}/{{total_fmt}}'
+                f'{_BRIGHT_YELLOW} [{{elapsed}}<{{remaining}}, {{rate_fmt}}]'
+                f'{_RESET}'
+            )
+            self._prompt_prefix = f"{_BRIGHT_YELLOW}{_BOLD}"
+            self._prompt_suffix = _RESET
+        else:
+            self._bar_format = None
+            self._prompt_prefix = self._prompt_suffix = ""
 
     def _supports_color(self):
         """Check if terminal supports color output"""
-        if os.name == 'nt':
-            # Enable color support on Windows 10+
-            try:
-                import colorama
-                colorama.init()
-                return True
-            except ImportError:
-                # Try to enable ANSI escape sequences on Windows
-                try:
-                    import ctypes
-                    kernel32 = ctypes.windll.kernel32
-                    kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
-                    return True
-                except:
-                    return False
-        else:
-            # Unix-like systems
-            return hasattr(self.file, 'isatty') and self.file.isatty()
+        is_atty = hasattr(self.file, 'isatty') and self.file.isatty()
+        return _terminal_supports_color(os.name == 'nt', is_atty)
 
     def _colorize_filename(self, filename):
         """Apply color to filename, trimming to 30 characters if needed"""
@@ -140,128 +198,113 @@ class ColoredProgressNotifier(object):
             filename = filename[:27] + "..."  # Trim to 27 chars + add "..." (total 30)
         if not self.use_colors:
             return filename
-        return f"{self.colors.BRIGHT_CYAN}{self.colors.BOLD}{filename}{self.colors.RESET}"
-
-    def _get_progress_color(self, percentage):
-        """Get color based on progress percentage"""
-        if not self.use_colors:
-            return ""
-        
-        if percentage < 25:
-            return self.colors.BRIGHT_RED
-        elif percentage < 50:
-            return self.colors.BRIGHT_YELLOW
-        elif percentage < 75:
-            return self.colors.BRIGHT_BLUE
-        elif percentage < 95:
-            return self.colors.BRIGHT_GREEN
-        else:
-            return self.colors.GREEN + self.colors.BOLD
-
-    def __call__(self, char, stdin=None):
-        if isinstance(char, unicode):
-            char = char.encode('ascii')
-        if char in b"\r\n":
-            line = self.newline()
-            if self.duration is None:
-                self.duration = self.get_duration(line)
-            if self.source is None:
-                self.source = self.get_source(line)
-            if self.fps is None:
-                self.fps = self.get_fps(line)
+        return f"{_BRIGHT_CYAN}{_BOLD}{filename}{_RESET}"
+
+    def __call__(self, data, stdin=None):
+        self.feed(data, stdin)
+
+    def feed(self, data, stdin=None):
+        """Process a chunk of bytes read from the `ffmpeg` standard error
+
+        Only `bytes` are accepted, callers with text should encode it first.
+        """
+        # the accumulator is only ever cleared in place, so its bound
+        # methods can be looked up once per chunk
+        acc = self.line_acc
+        endswith = acc.endswith
+        parts = self._NEWLINE_RX.split(data)
+        for index, part in enumerate(parts):
+            if index % 2:
+                self._process_line(self.newline())
+            elif part:
+                acc += part
+                if endswith(_PROMPT_SUFFIX):
+                    prompt_text = acc.decode(self.encoding)
+                    print(self._prompt_prefix + prompt_text + self._prompt_suffix, end="", file=self.file)
+                    self.file.flush()
+                    if stdin:
+                        stdin.put(input() + "\n")
+                    self.newline()
+
+    def _process_line(self, line):
+        if self._headers_done:
             self.progress(line)
-        else:
-            self.line_acc.extend(char)
-            if self.line_acc[-6:] == bytearray(b"[y/N] "):
-                prompt_text = self.line_acc.decode(self.encoding)
-                if self.use_colors:
-                    # Color the prompt
-                    colored_prompt = f"{self.colors.BRIGHT_YELLOW}{self.colors.BOLD}{prompt_text}{self.colors.RESET}"
-                    print(colored_prompt, end="", file=self.file)
-                else:
-                    print(prompt_text, end="", file=self.file)
-                self.file.flush()
-                if stdin:
-                    stdin.put(input() + "\n")
-                self.newline()
+            return
+        # most header lines (banner, stream and codec dumps) hold none of
+        # the fields, substring checks are enough to skip them
+        if not (b"time=" in line or b"Duration: " in line or b"from '" in line or b" fps" in line):
+            return
+        progressed = False
+        # a single pass extracts whichever fields the line contains, the
+        # inner groups of each alternative directly follow its named group
+        for match in self._SCAN_RX.finditer(line):
+            kind, index = match.lastgroup, match.lastindex
+            if kind == "progress":
+                # ffmpeg prints every input and output header before the
+                # first status line, so nothing is left to look for (audio
+                # inputs never report an fps)
+                progressed = True
+                self._update(self._seconds(*match.group(index + 1, index + 2, index + 3)))
+            elif kind == "duration":
+                if self.duration is None:
+                    self.duration = self._seconds(*match.group(index + 1, index + 2, index + 3))
+            elif kind == "source":
+                if self.source is None:
+                    self.source = os.path.basename(match.group(index + 1).decode(self.encoding))
+                    # Create colored description
+                    self._desc = self.source
+                    if self.use_colors and self.source:
+                        self._desc = self._colorize_filename(self.source)
+            elif kind == "fps":
+                if self.fps is None:
+                    self.fps = self._fps(*match.group(index + 1, index + 2))
+        # header fields are only printed once, so stop looking for them
+        self._headers_done = progressed or None not in (self.duration, self.source, self.fps)
 
     def newline(self):
         line = bytes(self.line_acc)
         self.lines.append(line)
-        self.line_acc = bytearray()
+        self.line_acc.clear()
         return line
 
-    def get_fps(self, line):
-        search = self._FPS_RX.search(line)
-        if search is not None:
-            return round(float(search.group(1)))
-        return None
-
-    def get_duration(self, line):
-        search = self._DURATION_RX.search(line)
-        if search is not None:
-            return self._seconds(*search.groups())
-        return None
-
-    def get_source(self, line):
-        search = self._SOURCE_RX.search(line)
-        if search is not None:
-            return os.path.basename(search.group(1).decode(self.encoding))
-        return None
-
     def progress(self, line):
-        search = self._PROGRESS_RX.search(line)
-        if search is not None:
-
-            total = self.duration
-            current = self._seconds(*search.groups())
-            unit = " seconds"
-
-            if self.fps is not None:
-                unit = " frames"
-                current *= self.fps
-                if total:
-                    total *= self.fps
-
-            if self.pbar is None:
-                # Create colored description
-                desc = self.source
-                if self.use_colors and desc:
-                    desc = self._colorize_filename(desc)
-                
-                # Create progress bar with custom format
-                bar_format = None
-                if self.use_colors:
-                    bar_format = (
-                        f'{self.colors.BRIGHT_WHITE}{{desc}}: '
-                        f'{self.colors.BRIGHT_GREEN}{{percentage:3.0f}}%'
-                        f'{self.colors.RESET}|{self.colors.BRIGHT_BLUE}{{bar}}{self.colors.RESET}| '
-                        f'{self.colors.WHITE}{{n_fmt}}/{{total_fmt}}'
-                        f'{self.colors.BRIGHT_YELLOW} [{{elapsed}}<{{remaining}}, {{rate_fmt}}]'
-                        f'{self.colors.RESET}'
-                    )
-
-                self.pbar = self.tqdm(
-                    desc=desc,
-                    file=self.file,
-                    total=total,
-                    dynamic_ncols=True,
-                    unit=unit,
-                    ncols=0,
-                    #ascii=os.name == "nt" and not self.use_colors,  # use unicode if colors are supported
-                    ascii='          ▒',
-                    bar_format=bar_format,
-                    colour='green' if self.use_colors else None,
-                )
-
-            # Update progress bar with color changes based on percentage
-            if total and self.use_colors:
-                percentage = (current / total) * 100
-                color = self._get_progress_color(percentage)
-                # Update the bar color dynamically
-                self.pbar.colour = 'green'
-
-            self.pbar.update(current - self.pbar.n)
+        # locate the field with a plain substring search, which is much
+        # cheaper than letting the regex engine scan the whole status line
+        index = line.find(b"time=")
+        if index >= 0:
+            match = self._PROGRESS_RX.match(line, index)
+            if match is not None:
+                self._update(self._seconds(*match.groups()))
+
+    def _update(self, current):
+        total = self.duration
+        unit = " seconds"
+
+        if self.fps is not None:
+            unit = " frames"
+            current *= self.fps
+            if total:
+                total *= self.fps
+
+        if self.pbar is None:
+            self.pbar = self.tqdm(
+                desc=self._desc,
+                file=self.file,
+                total=total,
+                dynamic_ncols=True,
+                unit=unit,
+                ncols=0,
+                #ascii=os.name == "nt" and not self.use_colors,  # use unicode if colors are supported
+                ascii='          ▒',
+                bar_format=self._bar_format,
+                colour='green' if self.use_colors else None,
+            )
+
+        # `time=` only advances once per second of output, so skip the
+        # redraw when ffmpeg reports the same position again
+        delta = current - self.pbar.n
+        if delta > 0:
+            self.pbar.update(delta)
 
 
 def main(argv=None, stream=sys.stderr, encoding=None, tqdm=tqdm, use_colors=True):
@@ -271,25 +314,25 @@ def main(argv=None, stream=sys.stderr, encoding=None, tqdm=tqdm, use_colors=True
         with ColoredProgressNotifier(file=stream, encoding=encoding, tqdm=tqdm, use_colors=use_colors) as notifier:
 
             cmd = ["ffmpeg"] + argv
-            p = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+            p = subprocess.Popen(cmd, stderr=subprocess.PIPE, bufsize=0)
 
-            while True:
-                out = p.stderr.read(1)
-                if out == b"" and p.poll() != None:
-                    break
-                if out != b"":
-                    notifier(out)
+            # read the pipe directly, the file object would only add
+            # locking and copies on top of the system call
+            fd = p.stderr.fileno()
+            for chunk in iter(lambda: os.read(fd, 65536), b""):
+                notifier.feed(chunk)
+            p.wait()
 
     except KeyboardInterrupt:
         if use_colors and hasattr(stream, 'isatty') and stream.isatty():
-            print(f"{Colors.BRIGHT_RED}{Colors.BOLD}Exiting.{Colors.RESET}", file=stream)
+            print(f"{_BRIGHT_RED}{_BOLD}Exiting.{_RESET}", file=stream)
         else:
             print("Exiting.", file=stream)
         return signal.SIGINT + 128  # POSIX standard
 
     except Exception as err:
         if use_colors and hasattr(stream, 'isatty') and stream.isatty():
-            print(f"{Colors.BRIGHT_RED}Unexpected exception: {Colors.BRIGHT_WHITE}{err}{Colors.RESET}", file=stream)
+            print(f"{_BRIGHT_RED}Unexpected exception: {_BRIGHT_WHITE}{err}{_RESET}", file=stream)
         else:
             print("Unexpected exception:", err, file=stream)
         return 1
@@ -298,7 +341,7 @@ def main(argv=None, stream=sys.stderr, encoding=None, tqdm=tqdm, use_colors=True
         if p.returncode != 0:
             error_msg = notifier.lines[-1].decode(notifier.encoding)
             if use_colors and hasattr(stream, 'isatty') and stream.isatty():
-                print(f"{Colors.BRIGHT_RED}{error_msg}{Colors.RESET}", file=stream)
+                print(f"{_BRIGHT_RED}{error_msg}{_RESET}", file=stream)
             else:
                 print(error_msg, file=stream)
         return p.returncode